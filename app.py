@@ -6,15 +6,17 @@
 """
 
 import streamlit as st
+import itertools
 import json
 import os
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 import traceback
 
 # 导入自定义模块
-from utils.ai_agent import create_ai_agent, extract_tags, create_default_prompt
+from utils.ai_agent import create_ai_agent, stream_tags, extract_tags_batch, create_default_prompt, iterate_async, run_async, hash_prompt, get_secret, build_prompt_lists
 from utils.data_loader import load_data_dicts
+from utils.semantic_cache import SemanticCache, find_terms, load_embedder
 
 # 配置页面
 st.set_page_config(
@@ -30,12 +32,118 @@ def load_cached_data():
     """缓存加载数据字典"""
     return load_data_dicts()
 
+# 缓存API密钥，避免每次重跑都读取Secrets
+@st.cache_resource
+def load_api_key() -> str:
+    """读取阿里百炼API密钥（环境变量优先，其次Streamlit Secrets），未配置时抛出KeyError，不缓存空值"""
+    api_key = get_secret("DASHSCOPE_API_KEY")
+    if not api_key:
+        raise KeyError("DASHSCOPE_API_KEY")
+    return api_key
+
+def get_api_key() -> str:
+    """获取API密钥，未配置时返回空字符串，配置后下次重跑即可读到"""
+    try:
+        return load_api_key()
+    except KeyError:
+        return ""
+
+# 用户输入的最大token数，过长的输入会拖慢模型的首字响应
+MAX_INPUT_TOKENS = 1024
+# 估算token数时每个token对应的字符数（len(text)//2，中英文混合文本的粗略值）
+CHARS_PER_TOKEN = 2
+
+def truncate_input(text: str, max_tokens: int = MAX_INPUT_TOKENS) -> str:
+    """按字符数估算token数，截断过长的用户输入（不使用需要联网下载词表的分词器）"""
+    return text[:max_tokens * CHARS_PER_TOKEN]
+
+# 缓存标签索引（只读元组和集合，避免每次重跑都重新生成列表）
+# 用cache_resource直接返回同一个对象；cache_data每次调用都会反序列化出一份新副本
+@st.cache_resource
+def index_dicts(_data_dicts) -> Dict[str, Any]:
+    """将数据字典展开为选项元组，并附带用于O(1)成员判断的集合和选项下标映射"""
+    return {
+        'countries': tuple(_data_dicts['countries']),
+        'degrees': tuple(_data_dicts['degrees']),
+        'majors': tuple(_data_dicts['majors']),
+        'sub_majors': {k: tuple(v['children']) for k, v in _data_dicts['majors'].items()},
+        'country_set': frozenset(_data_dicts['countries']),
+        'degree_set': frozenset(_data_dicts['degrees']),
+        'major_set': frozenset(_data_dicts['majors']),
+        'sub_major_sets': {k: frozenset(v['children']) for k, v in _data_dicts['majors'].items()},
+        'country_idx': {c: i for i, c in enumerate(_data_dicts['countries'])},
+        'degree_idx': {d: i for i, d in enumerate(_data_dicts['degrees'])},
+        'major_idx': {m: i for i, m in enumerate(_data_dicts['majors'])},
+        'sub_major_idx': {k: {s: i for i, s in enumerate(v['children'])} for k, v in _data_dicts['majors'].items()},
+        # 全部标签名称，语义缓存据此比较两次输入中字面出现的标签
+        'tag_terms': frozenset(itertools.chain(
+            _data_dicts['countries'], _data_dicts['degrees'], _data_dicts['majors'],
+            itertools.chain.from_iterable(v['children'] for v in _data_dicts['majors'].values())
+        ))
+    }
+
+# 缓存渲染后的提示词
+@st.cache_data
+def render_prompt(_data_dicts, template: str) -> str:
+    """将标签池填入提示词模板，模板不含变量名时原样返回"""
+    if not any(x in template for x in ["{country_list}", "{degree_list}", "{major_list}"]):
+        return template
+    country_list, degree_list, major_list = build_prompt_lists(_data_dicts)
+    return template.format(
+        country_list=country_list,
+        degree_list=degree_list,
+        major_list=major_list
+    )
+
+# 缓存AI代理（跨会话复用HTTP连接池）
+@st.cache_resource(show_spinner=False)
+def get_agent(model_name: str, prompt_hash: str, _system_prompt: str, _data_dicts):
+    """按(模型, 提示词哈希)复用AI代理"""
+    return create_ai_agent(
+        model_name=model_name,
+        data_dicts=_data_dicts,
+        custom_prompt=_system_prompt
+    )
+
+# 缓存句向量模型（未安装sentence-transformers时为None）
+@st.cache_resource(show_spinner="正在加载句向量模型...")
+def get_embedder():
+    """加载语义缓存使用的句向量模型"""
+    return load_embedder()
+
+# 每个(模型, 提示词哈希)一份语义缓存，跨会话共享
+@st.cache_resource(show_spinner=False)
+def get_semantic_cache(model_name: str, prompt_hash: str) -> Optional[SemanticCache]:
+    """获取语义缓存，句向量模型不可用时返回None"""
+    embedder = get_embedder()
+    return SemanticCache(embedder) if embedder is not None else None
+
+class RecognitionError(Exception):
+    """识别结果带有错误信息（如JSON解析失败），以异常形式抛出，避免被缓存"""
+    
+    def __init__(self, result: Dict[str, Any]):
+        super().__init__(result.get('error'))
+        self.result = result
+
+# 缓存识别结果
+@st.cache_data(ttl=3600, show_spinner=False)
+def recognize_tags(model_name: str, prompt_hash: str, user_input: str, _agent) -> Dict[str, Any]:
+    """按(模型, 提示词哈希, 输入)缓存识别结果，命中时回放AI输出并跳过模型调用；失败的结果不缓存"""
+    # 流式展示模型输出，完成后再解析完整JSON
+    with st.expander("🤔 AI思考中", expanded=True):
+        response_text = st.write_stream(iterate_async(stream_tags(_agent, user_input)))
+    result = _agent.build_result(response_text)
+    if result.get('error'):
+        raise RecognitionError(result)
+    return result
+
 # 可用的模型列表（阿里百炼）
 AVAILABLE_MODELS = {
-    "deepseek-v3": "DeepSeek-v3 (默认)",
-    "deepseek-r1": "DeepSeek-r1",
+    "qwen-turbo": "通义千问-turbo (默认)",
+    "deepseek-v3": "DeepSeek-v3",
     "qwen-plus": "通义千问-plus", 
-    "qwen-max": "通义千问-max"
+    "qwen-max": "通义千问-max",
+    "deepseek-r1": "DeepSeek-r1"
 }
 
 # 原始模板字符串，带变量名
@@ -63,15 +171,13 @@ DEFAULT_PROMPT_TEMPLATE = '''
    - 例如：理工科 → 计算机、商科 → 金融学
 
 ## 输出格式
-请严格按照以下JSON格式输出，不要包含任何其他文本：
-```json
+请严格按照以下JSON格式直接输出，不要使用代码块，不要包含任何其他文本：
 {{
   "country": "识别到的国家名称",
   "degree": "识别到的学历名称", 
   "major": "识别到的一级专业名称",
   "sub_major": "识别到的二级专业名称"
 }}
-```
 
 ## 注意事项
 
@@ -83,6 +189,32 @@ DEFAULT_PROMPT_TEMPLATE = '''
 现在请分析用户输入并提取标签：
 '''
 
+def register_prompt(data_dicts: Dict[str, Any], template: str) -> str:
+    """
+    渲染提示词模板并登记到会话的提示词注册表
+    
+    Args:
+        data_dicts: 数据字典
+        template: 提示词模板
+        
+    Returns:
+        模板哈希，同时写入 st.session_state['prompt_hash']
+    """
+    prompt_hash = hash_prompt(template)
+    registry = st.session_state.setdefault('prompt_registry', {})
+    if prompt_hash not in registry:
+        registry[prompt_hash] = render_prompt(data_dicts, template)
+    st.session_state['prompt_hash'] = prompt_hash
+    return prompt_hash
+
+def trigger_recognition():
+    """识别按钮回调：标记本次重跑需要调用模型"""
+    st.session_state['trigger_run'] = True
+
+def reset_sub_major(sub_majors: Dict[str, Tuple[str, ...]]):
+    """一级专业选择框回调：二级专业重置为新一级专业下的第一个选项"""
+    st.session_state['ai_sub_major'] = sub_majors[st.session_state['ai_major']][0]
+
 def main():
     """主函数"""
     st.title("🎓 留学标签识别系统")
@@ -102,11 +234,16 @@ def main():
         st.error(f"❌ 加载数据时出现错误: {str(e)}")
         return
         
+    # 首次运行时登记默认提示词
+    if 'prompt_hash' not in st.session_state:
+        register_prompt(data_dicts, st.session_state.get('custom_prompt', DEFAULT_PROMPT_TEMPLATE))
+
     # 读取所有标签池
-    country_options = list(data_dicts['countries'].keys())
-    degree_options = list(data_dicts['degrees'].keys())
-    major_options = list(data_dicts['majors'].keys())
-    default_sub_major_options = list(data_dicts['majors'][major_options[0]]['children'].keys())
+    tag_index = index_dicts(data_dicts)
+    country_options = tag_index['countries']
+    degree_options = tag_index['degrees']
+    major_options = tag_index['majors']
+    default_sub_major_options = tag_index['sub_majors'][major_options[0]]
     # 读取AI识别结果（如果有）
     ai_country = st.session_state.get('ai_country', country_options[0])
     ai_degree = st.session_state.get('ai_degree', degree_options[0])
@@ -121,8 +258,11 @@ def main():
         height=120,
         help="请输入包含学历、专业、国家信息的自然语言描述"
     )
-    if st.button("🚀 开始识别", type="primary"):
-        api_key = st.secrets.get("DASHSCOPE_API_KEY", "")
+    batch_mode = st.toggle("批量模式", help="每行一条描述，所有描述并发识别")
+    st.button("🚀 开始识别", type="primary", on_click=trigger_recognition)
+    # 只有点击识别后的那一次重跑才渲染提示词并调用模型，随后清除标记
+    if st.session_state.pop('trigger_run', False):
+        api_key = get_api_key()
         if not user_input.strip():
             st.warning("⚠️ 请先输入描述文本")
         elif not api_key:
@@ -130,52 +270,80 @@ def main():
         else:
             with st.spinner("🤖 AI正在分析中..."):
                 try:
-                    # 生成变量池
-                    country_list = "、".join(country_options)
-                    degree_list = "、".join(degree_options)
-                    major_list = "\n".join([
-                        f"{k}\n  - " + "\n  - ".join(v['children'].keys())
-                        for k, v in data_dicts['majors'].items()
-                    ])
-                    # 判断自定义提示词是否包含变量名
-                    prompt_to_use = st.session_state.get('custom_prompt', DEFAULT_PROMPT_TEMPLATE)
-                    if any(x in prompt_to_use for x in ["{country_list}", "{degree_list}", "{major_list}"]):
-                        prompt_to_use = prompt_to_use.format(
-                            country_list=country_list,
-                            degree_list=degree_list,
-                            major_list=major_list
-                        )
-                    agent = create_ai_agent(
-                        model_name=st.session_state.get('selected_model', list(AVAILABLE_MODELS.keys())[0]),
-                        data_dicts=data_dicts,
-                        custom_prompt=prompt_to_use
-                    )
-                    result = extract_tags(agent, user_input)
-                    st.session_state['last_result'] = result
-                    st.session_state['last_input'] = user_input
-                    # 批量更新session_state，避免控件冲突
-                    update_dict = {}
-                    if result.get('country') in country_options:
-                        update_dict['ai_country'] = result['country']
-                    if result.get('degree') in degree_options:
-                        update_dict['ai_degree'] = result['degree']
-                    if result.get('major') in major_options:
-                        update_dict['ai_major'] = result['major']
-                        sub_major_list = list(data_dicts['majors'][result['major']]['children'].keys())
-                        if result.get('sub_major') in sub_major_list:
-                            update_dict['ai_sub_major'] = result['sub_major']
+                    # 提示词在保存时已渲染，这里直接按哈希取用
+                    prompt_hash = st.session_state['prompt_hash']
+                    prompt_to_use = st.session_state['prompt_registry'][prompt_hash]
+                    model_name = st.session_state.get('selected_model', list(AVAILABLE_MODELS.keys())[0])
+                    agent = get_agent(model_name, prompt_hash, prompt_to_use, data_dicts)
+                    if batch_mode:
+                        # 每行一条描述，并发调用模型
+                        queries = [truncate_input(line.strip()) for line in user_input.splitlines() if line.strip()]
+                        results = run_async(extract_tags_batch(agent, queries))
+                        st.session_state['last_batch'] = list(zip(queries, results))
+                    else:
+                        truncated_input = truncate_input(user_input)
+                        if truncated_input != user_input:
+                            st.caption(f"✂️ 输入过长，已截断为约 {MAX_INPUT_TOKENS} 个token")
+                            user_input = truncated_input
+                        # 先查语义缓存，意思相近且字面标签词条一致的输入直接复用之前的识别结果
+                        semantic_cache = get_semantic_cache(model_name, prompt_hash)
+                        input_terms = find_terms(user_input, tag_index['tag_terms'])
+                        result = semantic_cache.lookup(user_input, input_terms) if semantic_cache else None
+                        if result is not None:
+                            st.caption("⚡ 命中语义缓存，已复用相近输入的识别结果")
                         else:
-                            update_dict['ai_sub_major'] = sub_major_list[0]
-                    st.session_state.update(update_dict)
+                            try:
+                                result = recognize_tags(model_name, prompt_hash, user_input, _agent=agent)
+                            except RecognitionError as e:
+                                # 失败结果照常展示，下次点击重新调用模型
+                                result = e.result
+                            if semantic_cache and not result.get('error'):
+                                semantic_cache.add(user_input, result, input_terms)
+                        st.session_state['last_result'] = result
+                        st.session_state['last_input'] = user_input
+                        # 批量更新session_state，避免控件冲突
+                        update_dict = {}
+                        if result.get('country') in tag_index['country_set']:
+                            update_dict['ai_country'] = result['country']
+                        if result.get('degree') in tag_index['degree_set']:
+                            update_dict['ai_degree'] = result['degree']
+                        if result.get('major') in tag_index['major_set']:
+                            update_dict['ai_major'] = result['major']
+                            sub_major_list = tag_index['sub_majors'][result['major']]
+                            if result.get('sub_major') in tag_index['sub_major_sets'][result['major']]:
+                                update_dict['ai_sub_major'] = result['sub_major']
+                            else:
+                                update_dict['ai_sub_major'] = sub_major_list[0]
+                        st.session_state.update(update_dict)
                 except Exception as e:
                     st.error(f"❌ 识别过程中出现错误: {str(e)}")
-                    st.error("详细错误信息:")
-                    st.code(traceback.format_exc())
+                    # 完整堆栈默认折叠，只在展开时查看
+                    with st.expander("调试详情", expanded=False):
+                        st.code(traceback.format_exc())
 
     # 2. 识别结果
     st.markdown("---")
     st.subheader("📊 识别结果")
-    if 'last_result' in st.session_state and 'last_input' in st.session_state:
+    if batch_mode and 'last_batch' in st.session_state:
+        st.markdown(f"**批量识别结果（共 {len(st.session_state['last_batch'])} 条）:**")
+        failed_count = sum(1 for _, result in st.session_state['last_batch'] if result.get('error'))
+        if failed_count:
+            st.error(f"❌ {failed_count} 条描述识别失败，详见表格中的错误列")
+        st.dataframe(
+            [
+                {
+                    "输入": query,
+                    "国家": result.get('country') or "未识别",
+                    "学历": result.get('degree') or "未识别",
+                    "专业": result.get('major') or "未识别",
+                    "二级专业": result.get('sub_major') or "未识别",
+                    "错误": result.get('error') or ""
+                }
+                for query, result in st.session_state['last_batch']
+            ],
+            width="stretch"
+        )
+    elif 'last_result' in st.session_state and 'last_input' in st.session_state:
         result = st.session_state['last_result']
         st.markdown("**原始输入:**")
         st.info(st.session_state['last_input'])
@@ -220,16 +388,23 @@ def main():
     # 3. 模拟选项框
     st.markdown("---")
     st.subheader("🎯 标签选择模拟（AI识别后自动联动）")
-    cols = st.columns(4)
-    with cols[0]:
-        country_select = st.selectbox("意向目的地", country_options, index=country_options.index(st.session_state.get('ai_country', country_options[0])), key="ai_country")
-    with cols[1]:
-        major_select = st.selectbox("意向专业（一级）", major_options, index=major_options.index(st.session_state.get('ai_major', major_options[0])), key="ai_major")
-    with cols[2]:
-        sub_major_options = list(data_dicts['majors'][st.session_state['ai_major']]['children'].keys())
-        sub_major_select = st.selectbox("意向专业（二级）", sub_major_options, index=sub_major_options.index(st.session_state.get('ai_sub_major', sub_major_options[0])) if st.session_state.get('ai_sub_major', sub_major_options[0]) in sub_major_options else 0, key="ai_sub_major")
-    with cols[3]:
-        degree_select = st.selectbox("学历", degree_options, index=degree_options.index(st.session_state.get('ai_degree', degree_options[0])), key="ai_degree")
+    # 一级专业放在表单外，切换后立即刷新二级专业选项
+    major_select = st.selectbox(
+        "意向专业（一级）", major_options,
+        index=tag_index['major_idx'].get(st.session_state.get('ai_major'), 0),
+        key="ai_major", on_change=reset_sub_major, args=(tag_index['sub_majors'],)
+    )
+    # 其余选项放在表单中，修改选项时不会触发整页重跑，点击"应用"后统一提交
+    with st.form("tag_form"):
+        cols = st.columns(3)
+        with cols[0]:
+            country_select = st.selectbox("意向目的地", country_options, index=tag_index['country_idx'].get(st.session_state.get('ai_country'), 0), key="ai_country")
+        with cols[1]:
+            sub_major_options = tag_index['sub_majors'][st.session_state['ai_major']]
+            sub_major_select = st.selectbox("意向专业（二级）", sub_major_options, index=tag_index['sub_major_idx'][st.session_state['ai_major']].get(st.session_state.get('ai_sub_major'), 0), key="ai_sub_major")
+        with cols[2]:
+            degree_select = st.selectbox("学历", degree_options, index=tag_index['degree_idx'].get(st.session_state.get('ai_degree'), 0), key="ai_degree")
+        st.form_submit_button("应用")
 
     # 4. 选择模型
     st.markdown("---")
@@ -241,11 +416,11 @@ def main():
         index=0,
         key="selected_model"
     )
-    api_key = st.secrets.get("DASHSCOPE_API_KEY", "")
+    api_key = get_api_key()
     if api_key:
         st.success("✅ API密钥已配置")
     else:
-        st.error("❌ 请在Streamlit Secrets中配置DASHSCOPE_API_KEY")
+        st.error("❌ 请在Streamlit Secrets或环境变量中配置DASHSCOPE_API_KEY")
 
     # 5. 自定义提示词
     st.markdown("---")
@@ -260,8 +435,13 @@ def main():
         help="留空将使用系统默认提示词"
     )
     if st.button("💾 保存提示词"):
-        st.session_state['custom_prompt'] = custom_prompt
-        st.success("✅ 提示词已保存到会话中")
+        try:
+            register_prompt(data_dicts, custom_prompt)
+        except (KeyError, ValueError, IndexError) as e:
+            st.error(f"❌ 提示词模板格式错误: {str(e)}")
+        else:
+            st.session_state['custom_prompt'] = custom_prompt
+            st.success("✅ 提示词已保存到会话中")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
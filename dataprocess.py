@@ -6,10 +6,13 @@
 """
 
 import pandas as pd
-import json
+import orjson
 import os
+from itertools import islice
 from pathlib import Path
 
+from utils.data_loader import BINARY_DATA_FILE, save_binary_data
+
 
 class DataProcessor:
     def __init__(self, data_dir="data"):
@@ -27,15 +30,12 @@ class DataProcessor:
         file_path = self.data_dir / filename
         
         try:
-            df = pd.read_csv(file_path, encoding='utf-8')
+            # 使用pyarrow引擎解析CSV，并且只读取需要的列
+            df = pd.read_csv(file_path, encoding='utf-8', engine='pyarrow', usecols=['id', 'name'])
             print(f"✅ 成功加载国家数据: {len(df)} 条记录")
             
-            # 创建字典：{中文名: id}
-            self.countries_dict = {}
-            for _, row in df.iterrows():
-                country_name = row['name']
-                country_id = row['id']
-                self.countries_dict[country_name] = country_id
+            # 创建字典：{中文名: id}，按列整体构建，避免逐行生成Series
+            self.countries_dict = dict(zip(df['name'].tolist(), df['id'].tolist()))
             
             print(f"📊 国家字典创建完成，包含 {len(self.countries_dict)} 个国家")
             return self.countries_dict
@@ -52,38 +52,36 @@ class DataProcessor:
         file_path = self.data_dir / filename
         
         try:
-            df = pd.read_csv(file_path, encoding='utf-8')
+            df = pd.read_csv(
+                file_path, encoding='utf-8', engine='pyarrow',
+                usecols=['id', 'name', 'parent_id', 'level', 'is_deleted']
+            )
             # 过滤掉已删除的记录
             df = df[df['is_deleted'] == 0]
             print(f"✅ 成功加载专业数据: {len(df)} 条有效记录")
             
-            # 分别获取一级和二级专业
-            level1_majors = df[df['level'] == 1]
-            level2_majors = df[df['level'] == 2]
-            
-            self.majors_dict = {}
+            # 一次分组同时得到一级和二级专业，缺少某一级时使用空表
+            level_groups = dict(iter(df.groupby('level', sort=False)))
+            level1_majors = level_groups.get(1, df.iloc[:0])
+            level2_majors = level_groups.get(2, df.iloc[:0])
             
             # 先创建一级专业
-            for _, row in level1_majors.iterrows():
-                major_name = row['name']
-                major_id = row['id']
-                self.majors_dict[major_name] = {
-                    'id': major_id,
-                    'children': {}
-                }
+            self.majors_dict = {
+                major_name: {'id': major_id, 'children': {}}
+                for major_name, major_id in zip(level1_majors['name'].tolist(), level1_majors['id'].tolist())
+            }
+            
+            # 一级专业id -> 名称索引，二级专业查找父级时无需逐个扫描
+            parent_index = {info['id']: name for name, info in self.majors_dict.items()}
             
             # 再添加二级专业
-            for _, row in level2_majors.iterrows():
-                major_name = row['name']
-                major_id = row['id']
-                parent_id = row['parent_id']
-                
+            for major_name, major_id, parent_id in zip(
+                level2_majors['name'].tolist(),
+                level2_majors['id'].tolist(),
+                level2_majors['parent_id'].tolist()
+            ):
                 # 找到对应的一级专业
-                parent_major = None
-                for level1_name, level1_data in self.majors_dict.items():
-                    if level1_data['id'] == parent_id:
-                        parent_major = level1_name
-                        break
+                parent_major = parent_index.get(parent_id)
                 
                 if parent_major:
                     self.majors_dict[parent_major]['children'][major_name] = major_id
@@ -110,17 +108,13 @@ class DataProcessor:
         file_path = self.data_dir / filename
         
         try:
-            df = pd.read_csv(file_path, encoding='utf-8')
+            df = pd.read_csv(file_path, encoding='utf-8', engine='pyarrow', usecols=['id', 'name', 'is_deleted'])
             # 过滤掉已删除的记录
             df = df[df['is_deleted'] == 0]
             print(f"✅ 成功加载学历数据: {len(df)} 条有效记录")
             
             # 创建字典：{学历名称: id}
-            self.degrees_dict = {}
-            for _, row in df.iterrows():
-                degree_name = row['name']
-                degree_id = row['id']
-                self.degrees_dict[degree_name] = degree_id
+            self.degrees_dict = dict(zip(df['name'].tolist(), df['id'].tolist()))
             
             print(f"📊 学历字典创建完成，包含 {len(self.degrees_dict)} 种学历")
             return self.degrees_dict
@@ -151,35 +145,57 @@ class DataProcessor:
         output_path.mkdir(exist_ok=True)
         
         try:
+            # orjson直接输出UTF-8字节（不转义中文），缩进2格
+            json_options = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+            
             # 保存国家字典
             countries_file = output_path / "countries_dict.json"
-            with open(countries_file, 'w', encoding='utf-8') as f:
-                json.dump(self.countries_dict, f, ensure_ascii=False, indent=2)
+            countries_bytes = orjson.dumps(self.countries_dict, option=json_options)
+            countries_file.write_bytes(countries_bytes)
             
             # 保存专业字典
             majors_file = output_path / "majors_dict.json"
-            with open(majors_file, 'w', encoding='utf-8') as f:
-                json.dump(self.majors_dict, f, ensure_ascii=False, indent=2)
+            majors_bytes = orjson.dumps(self.majors_dict, option=json_options)
+            majors_file.write_bytes(majors_bytes)
             
             # 保存学历字典
             degrees_file = output_path / "degrees_dict.json"
-            with open(degrees_file, 'w', encoding='utf-8') as f:
-                json.dump(self.degrees_dict, f, ensure_ascii=False, indent=2)
+            degrees_bytes = orjson.dumps(self.degrees_dict, option=json_options)
+            degrees_file.write_bytes(degrees_bytes)
             
-            # 保存合并的字典
+            # 保存合并的字典：复用上面已序列化的字节逐段写入，不再构建合并字典
+            # （嵌套一层后每行多缩进2格，JSON字符串内不含换行符，可直接替换）
             all_data_file = output_path / "all_data_dict.json"
-            all_data = {
+            with open(all_data_file, 'wb') as f:
+                f.write(b'{\n  "countries": ')
+                f.write(countries_bytes.replace(b'\n', b'\n  '))
+                f.write(b',\n  "majors": ')
+                f.write(majors_bytes.replace(b'\n', b'\n  '))
+                f.write(b',\n  "degrees": ')
+                f.write(degrees_bytes.replace(b'\n', b'\n  '))
+                f.write(b'\n}')
+            
+            print(f"💾 所有字典已保存到 {output_path} 目录")
+            
+        except Exception as e:
+            print(f"❌ 保存文件失败: {e}")
+    
+    def save_binary(self, output_dir="output"):
+        """保存所有字典到一个pickle文件，应用加载时无需解析JSON"""
+        output_path = Path(output_dir)
+        output_path.mkdir(exist_ok=True)
+        
+        try:
+            save_binary_data(output_path, {
                 'countries': self.countries_dict,
                 'majors': self.majors_dict,
                 'degrees': self.degrees_dict
-            }
-            with open(all_data_file, 'w', encoding='utf-8') as f:
-                json.dump(all_data, f, ensure_ascii=False, indent=2)
+            })
             
-            print(f"💾 所有字典已保存到 {output_path} 目录")
+            print(f"💾 二进制数据已保存到 {output_path / BINARY_DATA_FILE}")
             
         except Exception as e:
-            print(f"❌ 保存文件失败: {e}")
+            print(f"❌ 保存二进制文件失败: {e}")
     
     def display_sample_data(self):
         """显示示例数据"""
@@ -189,22 +205,22 @@ class DataProcessor:
         
         # 显示国家数据样本
         print("\n🌍 国家数据样本:")
-        for i, (name, country_id) in enumerate(list(self.countries_dict.items())[:5]):
+        for i, (name, country_id) in enumerate(islice(self.countries_dict.items(), 5)):
             print(f"  {name}: {country_id}")
         print(f"  ... 共 {len(self.countries_dict)} 个国家")
         
         # 显示专业数据样本
         print("\n📚 专业数据样本:")
-        for i, (level1_name, level1_data) in enumerate(list(self.majors_dict.items())[:3]):
+        for i, (level1_name, level1_data) in enumerate(islice(self.majors_dict.items(), 3)):
             print(f"  {level1_name} (id: {level1_data['id']}):")
-            for j, (level2_name, level2_id) in enumerate(list(level1_data['children'].items())[:3]):
+            for j, (level2_name, level2_id) in enumerate(islice(level1_data['children'].items(), 3)):
                 print(f"    └─ {level2_name}: {level2_id}")
             if len(level1_data['children']) > 3:
                 print(f"    └─ ... 共 {len(level1_data['children'])} 个二级专业")
         
         # 显示学历数据样本
         print("\n🎓 学历数据样本:")
-        for i, (name, degree_id) in enumerate(list(self.degrees_dict.items())[:8]):
+        for i, (name, degree_id) in enumerate(islice(self.degrees_dict.items(), 8)):
             print(f"  {name}: {degree_id}")
         if len(self.degrees_dict) > 8:
             print(f"  ... 共 {len(self.degrees_dict)} 种学历")
@@ -227,6 +243,9 @@ def main():
     # 保存到JSON文件
     processor.save_to_json()
     
+    # 保存二进制文件（需在JSON之后写入，否则会被视为过期）
+    processor.save_binary()
+    
     print("\n✅ 数据处理完成！")
     print(f"💡 你现在可以在Python中这样使用：")
     print("""
@@ -4,23 +4,21 @@
 应用启动脚本
 """
 
-import subprocess
+import importlib.util
 import sys
 import os
 from pathlib import Path
 
 def check_requirements():
     """检查依赖是否安装"""
-    try:
-        import streamlit
-        import langchain
-        import pandas
-        print("✅ 依赖检查通过")
-        return True
-    except ImportError as e:
-        print(f"❌ 缺少依赖: {e}")
+    # 只查找模块是否存在，不实际导入，避免启动前白白初始化pandas/langchain
+    missing = [name for name in ("streamlit", "langchain", "pandas") if importlib.util.find_spec(name) is None]
+    if missing:
+        print(f"❌ 缺少依赖: {', '.join(missing)}")
         print("请运行: pip install -r requirements.txt")
         return False
+    print("✅ 依赖检查通过")
+    return True
 
 def check_config():
     """检查配置文件"""
@@ -49,14 +47,13 @@ def main():
     print("按 Ctrl+C 停止应用")
     print("=" * 50)
     
-    # 启动streamlit
+    # 在当前进程内启动streamlit，避免再启动一个解释器重复导入依赖
+    from streamlit.web import bootstrap
+    
     try:
-        subprocess.run([sys.executable, "-m", "streamlit", "run", "app.py"], check=True)
+        bootstrap.run("app.py", False, [], flag_options={})
     except KeyboardInterrupt:
         print("\n👋 应用已停止")
-    except FileNotFoundError:
-        print("❌ Streamlit未安装，请运行: pip install streamlit")
-        sys.exit(1)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
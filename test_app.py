@@ -106,6 +106,303 @@ def test_data_validation():
     return True
 
 
+def test_data_cache():
+    """测试数据字典缓存"""
+    print("\n=== 测试数据字典缓存 ===")
+    
+    first = load_data_dicts()
+    second = load_data_dicts()
+    
+    if first is None or first is not second:
+        print("❌ 文件未修改时应返回同一个缓存对象")
+        return False
+    
+    print("✅ 重复加载直接命中缓存")
+    return True
+
+
+def _create_stub_agent(replies, custom_prompt="测试提示词"):
+    """创建使用桩模型的AI代理，replies 为 用户消息 -> 模型回复 的映射"""
+    import os
+    from utils import ai_agent
+    
+    class StubMessage:
+        def __init__(self, content):
+            self.content = content
+    
+    class StubLLM:
+        """按用户消息内容返回固定回复，并记录调用次数和绑定的调用参数"""
+        def __init__(self):
+            self.calls = []
+            self.bound_kwargs = {}
+        
+        def bind(self, **kwargs):
+            self.bound_kwargs.update(kwargs)
+            return self
+        
+        def invoke(self, messages):
+            self.calls.append(messages[-1].content)
+            return StubMessage(replies[messages[-1].content])
+        
+        async def ainvoke(self, messages):
+            return self.invoke(messages)
+    
+    stub = StubLLM()
+    saved_key = os.environ.get("DASHSCOPE_API_KEY")
+    saved_get_llm = ai_agent._get_llm
+    os.environ["DASHSCOPE_API_KEY"] = saved_key or "test-key"
+    ai_agent._get_llm = lambda model_name, api_key: stub
+    try:
+        agent = ai_agent.create_ai_agent("qwen-turbo", load_data_dicts(), custom_prompt=custom_prompt)
+    finally:
+        ai_agent._get_llm = saved_get_llm
+        if saved_key is None:
+            del os.environ["DASHSCOPE_API_KEY"]
+    return agent
+
+
+def test_json_mode():
+    """测试JSON模式只在提示词提到JSON时启用"""
+    print("\n=== 测试JSON模式 ===")
+    
+    reply = {"我想读英国硕士": '{"country": "英国", "degree": "硕士"}'}
+    
+    # 默认提示词要求输出JSON，启用JSON模式
+    agent = _create_stub_agent(reply, custom_prompt=None)
+    if agent.llm.bound_kwargs.get('response_format') != {"type": "json_object"}:
+        print("❌ 默认提示词应启用JSON模式")
+        return False
+    
+    # 未提到JSON的自定义提示词不启用JSON模式，仍可正常提取
+    agent = _create_stub_agent(reply, custom_prompt="请提取国家和学历")
+    if 'response_format' in agent.llm.bound_kwargs:
+        print("❌ 未提到JSON的自定义提示词不应启用JSON模式")
+        return False
+    result = agent.extract("我想读英国硕士")
+    if (result.get('country'), result.get('degree')) != ("英国", "硕士"):
+        print(f"❌ 自定义提示词提取结果不正确: {result}")
+        return False
+    
+    print("✅ JSON模式按提示词启用")
+    return True
+
+
+def test_parse_and_validate():
+    """测试模型响应解析与标签验证"""
+    print("\n=== 测试响应解析与验证 ===")
+    
+    agent = _create_stub_agent({})
+    cases = [
+        # 纯JSON，二级专业属于一级专业
+        ('{"country": "英国", "degree": "硕士", "major": "理工科", "sub_major": "统计学"}',
+         {"country": "英国", "degree": "硕士", "major": "理工科", "sub_major": "统计学"}),
+        # 代码块包裹，二级专业不属于该一级专业
+        ('好的\n```json\n{"country": "英国", "major": "理工科", "sub_major": "金融学"}\n```',
+         {"country": "英国", "degree": None, "major": "理工科", "sub_major": None}),
+        # JSON前后夹杂文字
+        ('结果：{"country": "美国", "degree": "博士"} 完毕',
+         {"country": "美国", "degree": "博士", "major": None, "sub_major": None}),
+        # 标签池外的值置为None，一级专业无效时二级专业也无效
+        ('{"country": "火星", "degree": "硕士", "major": "不存在", "sub_major": "金融学"}',
+         {"country": None, "degree": "硕士", "major": None, "sub_major": None}),
+    ]
+    for response_text, expected in cases:
+        result = {k: v for k, v in agent.build_result(response_text).items() if not k.startswith('_')}
+        if result != expected:
+            print(f"❌ 解析结果不正确: {response_text!r} -> {result}")
+            return False
+    
+    result = agent.build_result("无法解析的回复")
+    if not result.get('error') or any(result[k] for k in ("country", "degree", "major", "sub_major")):
+        print(f"❌ 无效JSON应返回错误信息: {result}")
+        return False
+    
+    print("✅ 响应解析与验证正常")
+    return True
+
+
+def test_extract_batch():
+    """测试单次调用的批量提取及其回退"""
+    print("\n=== 测试批量提取 ===")
+    
+    inputs = ["英国硕士", "美国本科"]
+    batch_message = "[0] 英国硕士\n[1] 美国本科"
+    single_replies = {
+        "英国硕士": '{"country": "英国", "degree": "硕士"}',
+        "美国本科": '{"country": "美国", "degree": "本科"}'
+    }
+    expected = [("英国", "硕士"), ("美国", "本科")]
+    
+    def summarize(results):
+        return [(r.get('country'), r.get('degree')) for r in results]
+    
+    # 正常情况：一次调用返回全部结果
+    agent = _create_stub_agent({
+        batch_message: '{"results": [{"country": "英国", "degree": "硕士"}, {"country": "美国", "degree": "本科"}]}'
+    })
+    results = agent.extract_batch(inputs)
+    if summarize(results) != expected or agent.llm.calls != [batch_message]:
+        print(f"❌ 批量提取结果不正确: {results}")
+        return False
+    
+    # 结果条数不符、JSON无效时退回逐条提取
+    for batch_reply in ('{"results": [{"country": "英国", "degree": "硕士"}]}', '不是JSON'):
+        agent = _create_stub_agent({batch_message: batch_reply, **single_replies})
+        results = agent.extract_batch(inputs)
+        if summarize(results) != expected or sorted(agent.llm.calls[1:]) != sorted(inputs):
+            print(f"❌ 批量响应为 {batch_reply!r} 时未正确回退: {results}")
+            return False
+    
+    print("✅ 批量提取及回退正常")
+    return True
+
+
+def test_binary_data():
+    """测试二进制数据文件的写入、读取与失效"""
+    print("\n=== 测试二进制数据文件 ===")
+    
+    import os
+    import pickle
+    import tempfile
+    from utils.data_loader import DATA_FILES, BINARY_DATA_FILE, BINARY_DATA_VERSION
+    
+    json_data = {'countries': {"美国": 1}, 'majors': {}, 'degrees': {"硕士": 2}}
+    binary_data = {'countries': {"英国": 3}, 'majors': {}, 'degrees': {"硕士": 2}}
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_files = [Path(tmp_dir) / filename for filename in DATA_FILES.values()]
+        for key, filename in DATA_FILES.items():
+            (Path(tmp_dir) / filename).write_text(json.dumps(json_data[key], ensure_ascii=False), encoding="utf-8")
+        binary_file = Path(tmp_dir) / BINARY_DATA_FILE
+        
+        def touch_json(mtime):
+            # 修改JSON文件时间，使缓存键变化
+            for json_file in json_files:
+                os.utime(json_file, (mtime, mtime))
+        
+        def write_binary(version, mtime):
+            payload = {'version': version, 'data': binary_data}
+            binary_file.write_bytes(pickle.dumps(payload, protocol=5))
+            os.utime(binary_file, (mtime, mtime))
+        
+        base_mtime = json_files[0].stat().st_mtime
+        
+        if load_data_dicts(tmp_dir) != json_data or not binary_file.exists():
+            print("❌ 解析JSON后应写回二进制文件")
+            return False
+        if pickle.loads(binary_file.read_bytes()) != {'version': BINARY_DATA_VERSION, 'data': json_data}:
+            print("❌ 写回的二进制文件内容不正确")
+            return False
+        
+        touch_json(base_mtime + 10)
+        write_binary(BINARY_DATA_VERSION, base_mtime + 20)
+        if load_data_dicts(tmp_dir) != binary_data:
+            print("❌ 二进制文件较新时应优先读取")
+            return False
+        
+        touch_json(base_mtime + 30)
+        write_binary(BINARY_DATA_VERSION + 1, base_mtime + 40)
+        if load_data_dicts(tmp_dir) != json_data:
+            print("❌ 版本不符时应改用JSON文件")
+            return False
+        
+        touch_json(base_mtime + 60)
+        write_binary(BINARY_DATA_VERSION, base_mtime + 50)
+        if load_data_dicts(tmp_dir) != json_data:
+            print("❌ 二进制文件比JSON旧时应改用JSON文件")
+            return False
+    
+    print("✅ 二进制数据文件按新鲜度和版本读取，解析JSON后自动写回")
+    return True
+
+
+def test_flat_major_mapping():
+    """测试扁平化专业映射"""
+    print("\n=== 测试扁平化专业映射 ===")
+    
+    from utils.data_loader import get_flat_major_mapping
+    
+    majors = {
+        "商科": {"id": 1, "children": {"金融": 11, "会计": 12}},
+        "工科": {"id": 2, "children": {"计算机": 21}}
+    }
+    expected = {"商科": "商科", "金融": "商科", "会计": "商科", "工科": "工科", "计算机": "工科"}
+    
+    mapping = get_flat_major_mapping(majors)
+    if mapping != expected:
+        print(f"❌ 映射结果不正确: {mapping}")
+        return False
+    
+    if get_flat_major_mapping(majors) is not mapping:
+        print("❌ 同一个专业字典应直接返回缓存的映射")
+        return False
+    
+    print("✅ 专业映射正确且已缓存")
+    return True
+
+
+def test_semantic_cache():
+    """测试语义缓存"""
+    print("\n=== 测试语义缓存 ===")
+    
+    import numpy as np
+    from utils.semantic_cache import SemanticCache, find_terms
+    
+    class FakeEmbedder:
+        """固定向量的句向量模型（向量已归一化）"""
+        vectors = {
+            "想去英国读硕": [1.0, 0.0],
+            "英国的硕士申请": [0.96, 0.28],
+            "想去美国读硕": [0.99, 0.14],
+            "美国本科": [0.0, 1.0]
+        }
+        
+        def encode(self, text, normalize_embeddings=True):
+            if text not in self.vectors:
+                raise RuntimeError("模型推理失败")
+            return np.array(self.vectors[text])
+    
+    cache = SemanticCache(FakeEmbedder(), threshold=0.93, max_size=1)
+    if cache.lookup("想去英国读硕") is not None:
+        print("❌ 空缓存不应命中")
+        return False
+    
+    result = {"country": "英国", "degree": "硕士", "major": None, "sub_major": None}
+    cache.add("想去英国读硕", result)
+    if cache.lookup("英国的硕士申请") != result:
+        print("❌ 语义相近的输入未命中缓存")
+        return False
+    if cache.lookup("美国本科") is not None:
+        print("❌ 语义不同的输入不应命中缓存")
+        return False
+    
+    # 字面标签词条不同（英国/美国）时，即使整句向量相近也不命中
+    cache = SemanticCache(FakeEmbedder(), threshold=0.93, max_size=1)
+    vocabulary = ("英国", "美国", "硕士", "本科")
+    cache.add("想去英国读硕", result, find_terms("想去英国读硕", vocabulary))
+    if cache.lookup("想去美国读硕", find_terms("想去美国读硕", vocabulary)) is not None:
+        print("❌ 标签词条不同的输入不应命中缓存")
+        return False
+    if cache.lookup("想去英国读硕", find_terms("想去英国读硕", vocabulary)) != result:
+        print("❌ 标签词条一致的输入应命中缓存")
+        return False
+    
+    # 句向量计算失败时视为未命中，不抛出异常
+    if cache.lookup("无法编码的输入") is not None:
+        print("❌ 句向量计算失败时应视为未命中")
+        return False
+    cache.add("无法编码的输入", result)
+    
+    # 超出容量时淘汰最久未使用的条目
+    cache.add("美国本科", {"country": "美国", "degree": "本科", "major": None, "sub_major": None})
+    if cache.lookup("想去英国读硕") is not None:
+        print("❌ 超出容量的条目未被淘汰")
+        return False
+    
+    print("✅ 语义缓存命中与淘汰正常")
+    return True
+
+
 def main():
     """主测试函数"""
     print("🧪 开始测试留学标签识别应用")
@@ -114,7 +411,14 @@ def main():
     tests = [
         ("数据加载", test_data_loading),
         ("提示词生成", test_prompt_generation),
-        ("数据完整性", test_data_validation)
+        ("数据完整性", test_data_validation),
+        ("数据缓存", test_data_cache),
+        ("二进制数据", test_binary_data),
+        ("专业映射", test_flat_major_mapping),
+        ("响应解析", test_parse_and_validate),
+        ("批量提取", test_extract_batch),
+        ("JSON模式", test_json_mode),
+        ("语义缓存", test_semantic_cache)
     ]
     
     passed = 0
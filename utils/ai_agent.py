@@ -6,10 +6,15 @@ AI代理模块
 """
 
 import os
-import json
 import re
-from typing import Dict, Any, Optional
-import streamlit as st
+import asyncio
+import functools
+import hashlib
+import threading
+import weakref
+from typing import Dict, Any, List, Optional, Tuple, Coroutine, AsyncIterator, Iterator
+import httpx
+import orjson
 
 # LangChain导入
 from langchain_openai import ChatOpenAI
@@ -19,16 +24,179 @@ try:
 except ImportError:
     from langchain.schema import HumanMessage, SystemMessage
 
-from langchain.prompts import PromptTemplate
-
 # 数据处理工具
-from .data_loader import get_country_list, get_degree_list, get_major_list, get_flat_major_mapping
+from .data_loader import get_country_list, get_degree_list, get_major_list, get_flat_major_mapping, cache_by_identity
+
+
+# 预编译：从夹杂其他文本的响应中提取JSON对象
+_JSON_RE = re.compile(r"\{[^{}]*\}", re.S)
+
+# 各模型的调用参数：标签提取只需输出4个短字段，统一用确定性采样和较小的输出上限
+_DEFAULT_MODEL_PARAMS = {
+    "temperature": 0,
+    "top_p": 1,
+    "max_tokens": 128
+}
+
+MODEL_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "qwen-turbo": _DEFAULT_MODEL_PARAMS,
+    "qwen-plus": _DEFAULT_MODEL_PARAMS,
+    "qwen-max": _DEFAULT_MODEL_PARAMS,
+    "deepseek-v3": _DEFAULT_MODEL_PARAMS,
+    # 推理模型不支持采样参数，只限制回答长度
+    "deepseek-r1": {"max_tokens": 128}
+}
+
+# JSON模式：约束输出为JSON对象，避免模型输出解释性文字或代码块。
+# 接口要求消息中出现"json"字样，因此只在系统提示词提到JSON时启用；推理模型不支持JSON模式
+_JSON_RESPONSE_FORMAT = {"type": "json_object"}
+_NO_JSON_MODE_MODELS = frozenset({"deepseek-r1"})
+
+# 阿里百炼的OpenAI兼容接口地址
+DASHSCOPE_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+# 批量提取时追加到系统提示词后的说明
+_BATCH_INSTRUCTION = """
+
+## 批量识别
+
+用户会一次提供多条描述，每条以"[序号]"开头。请对每条描述分别按上述规则提取标签，
+并只输出一个JSON对象：{"results": [每条描述的识别结果, ...]}，
+results 中的结果按序号顺序排列，数量与描述条数一致。
+"""
+
+# 后台事件循环：异步HTTP连接绑定在创建它的事件循环上，
+# asyncio.run 每次都会关闭循环，因此所有协程统一提交到这个常驻循环执行
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+_event_loop_lock = threading.Lock()
+
+
+def _get_event_loop() -> asyncio.AbstractEventLoop:
+    """获取（必要时启动）后台事件循环"""
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            threading.Thread(target=_event_loop.run_forever, name="ai-agent-loop", daemon=True).start()
+    return _event_loop
+
+
+def run_async(coro: Coroutine) -> Any:
+    """
+    在后台事件循环中执行协程并等待结果
+    
+    Args:
+        coro: 协程对象
+        
+    Returns:
+        协程的返回值
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_event_loop()).result()
 
 
+async def _anext(agen: AsyncIterator) -> Any:
+    return await agen.__anext__()
+
+
+def iterate_async(agen: AsyncIterator) -> Iterator:
+    """
+    将异步生成器转换为同步生成器（在后台事件循环中逐项取值）
+    
+    Args:
+        agen: 异步生成器
+        
+    Returns:
+        同步生成器，可直接交给 st.write_stream
+    """
+    try:
+        while True:
+            try:
+                yield run_async(_anext(agen))
+            except StopAsyncIteration:
+                return
+    finally:
+        run_async(agen.aclose())
+
+
+# 每个事件循环各自的连接池：httpx连接绑定在创建它的事件循环上，
+# 调用方用 asyncio.run 时每次都是新循环，不能复用旧循环上的连接
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_loop_clients_lock = threading.Lock()
+
+
+def _get_loop_client() -> httpx.AsyncClient:
+    """获取当前运行中事件循环的HTTP客户端（必要时创建）"""
+    loop = asyncio.get_running_loop()
+    with _loop_clients_lock:
+        client = _loop_clients.get(loop)
+        if client is None:
+            # 连接持有循环的引用，弱引用无法自动回收，创建时顺带清理已关闭循环的客户端
+            for closed_loop in [item for item in _loop_clients if item.is_closed()]:
+                del _loop_clients[closed_loop]
+            client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+            )
+            _loop_clients[loop] = client
+    return client
+
+
+class _LoopLocalAsyncClient(httpx.AsyncClient):
+    """把请求转发给当前事件循环专用客户端的异步HTTP客户端"""
+    
+    async def send(self, request: httpx.Request, **kwargs: Any) -> httpx.Response:
+        return await _get_loop_client().send(request, **kwargs)
+    
+    async def aclose(self) -> None:
+        loop = asyncio.get_running_loop()
+        with _loop_clients_lock:
+            client = _loop_clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+
+@functools.lru_cache(maxsize=1)
+def get_http_async_client() -> httpx.AsyncClient:
+    """
+    获取所有代理共享的异步HTTP客户端
+    
+    启用HTTP/2多路复用并保持长连接，同一事件循环上的并发请求共用一个连接池，
+    无需为每个请求重复建立TCP/TLS连接；不同事件循环（如多次 asyncio.run）各用各的连接池
+    
+    Returns:
+        httpx.AsyncClient 实例
+    """
+    return _LoopLocalAsyncClient()
+
+
+def get_secret(key: str) -> str:
+    """
+    读取密钥，优先使用环境变量，其次使用 Streamlit Secrets
+    
+    streamlit 在此延迟导入，测试和批处理脚本等非界面场景无需加载它。
+    
+    Args:
+        key: 密钥名称
+        
+    Returns:
+        密钥值，未配置时返回空字符串
+    """
+    value = os.environ.get(key)
+    if value:
+        return value
+    try:
+        import streamlit as st
+        return st.secrets.get(key, "")
+    except Exception:
+        # 未安装streamlit或没有secrets.toml
+        return ""
+
+
+@functools.lru_cache(maxsize=1)
 def setup_langsmith():
-    """设置LangSmith追踪"""
+    """设置LangSmith追踪（每个进程只读取一次密钥）"""
     try:
-        langchain_api_key = st.secrets.get("LANGCHAIN_API_KEY", "")
+        langchain_api_key = get_secret("LANGCHAIN_API_KEY")
         if langchain_api_key:
             os.environ["LANGCHAIN_TRACING_V2"] = "true"
             os.environ["LANGCHAIN_API_KEY"] = langchain_api_key
@@ -39,34 +207,40 @@ def setup_langsmith():
     return False
 
 
-def create_default_prompt(data_dicts: Dict[str, Any]) -> str:
+def hash_prompt(prompt: str) -> str:
     """
-    创建默认提示词
+    计算提示词的短哈希，用作缓存键
     
     Args:
-        data_dicts: 数据字典
+        prompt: 提示词字符串
         
     Returns:
-        默认提示词字符串
+        32位十六进制哈希字符串
     """
-    
-    country_list = get_country_list(data_dicts['countries'])
-    degree_list = get_degree_list(data_dicts['degrees'])
-    major_list = get_major_list(data_dicts['majors'])
-    
-    prompt = f"""
+    return hashlib.blake2b(prompt.encode('utf-8'), digest_size=16).hexdigest()
+
+
+@cache_by_identity
+def build_prompt_lists(data_dicts: Dict[str, Any]) -> Tuple[str, str, str]:
+    """生成国家、学历、专业标签池字符串（同一份数据字典只生成一次）"""
+    return (
+        get_country_list(data_dicts['countries']),
+        get_degree_list(data_dicts['degrees']),
+        get_major_list(data_dicts['majors'])
+    )
+
+
+# 默认提示词的固定片段，生成提示词时与标签池字符串直接拼接
+_PROMPT_HEAD = """
 你是一个专业的留学标签识别助手。你的任务是从用户输入的自然语言中准确提取出国家、专业、学历三个标签。
 
 ## 标签池（你只能从以下标签中选择，不能自创标签）
 
 ### 国家标签池：
-{country_list}
-
-### 学历标签池：
-{degree_list}
-
-### 专业标签池：
-{major_list}
+"""
+_PROMPT_DEGREES = "\n\n### 学历标签池：\n"
+_PROMPT_MAJORS = "\n\n### 专业标签池：\n"
+_PROMPT_TAIL = """
 
 ## 提取规则
 
@@ -79,16 +253,14 @@ def create_default_prompt(data_dicts: Dict[str, Any]) -> str:
 
 ## 输出格式
 
-请严格按照以下JSON格式输出，不要包含任何其他文本：
+请严格按照以下JSON格式直接输出，不要使用代码块，不要包含任何其他文本：
 
-```json
-{{
+{
   "country": "识别到的国家名称",
   "degree": "识别到的学历名称", 
   "major": "识别到的一级专业名称",
   "sub_major": "识别到的二级专业名称"
-}}
-```
+}
 
 ## 注意事项
 
@@ -99,8 +271,46 @@ def create_default_prompt(data_dicts: Dict[str, Any]) -> str:
 
 现在请分析用户输入并提取标签：
 """
+
+
+def create_default_prompt(data_dicts: Dict[str, Any]) -> str:
+    """
+    创建默认提示词
+    
+    Args:
+        data_dicts: 数据字典
+        
+    Returns:
+        默认提示词字符串
+    """
     
-    return prompt
+    country_list, degree_list, major_list = build_prompt_lists(data_dicts)
+    
+    return "".join((_PROMPT_HEAD, country_list, _PROMPT_DEGREES, degree_list, _PROMPT_MAJORS, major_list, _PROMPT_TAIL))
+
+
+@functools.lru_cache(maxsize=8)
+def _get_llm(model_name: str, api_key: str, base_url: str = DASHSCOPE_BASE_URL) -> ChatOpenAI:
+    """
+    创建聊天模型，按(模型, 密钥, 接口地址)缓存，多个代理共用同一实例及其HTTP连接池
+    
+    Args:
+        model_name: 模型名称
+        api_key: 阿里百炼API密钥
+        base_url: OpenAI兼容接口地址
+        
+    Returns:
+        ChatOpenAI实例
+    """
+    return ChatOpenAI(
+        api_key=api_key,
+        model=model_name,
+        base_url=base_url,
+        timeout=30,
+        max_retries=2,
+        http_async_client=get_http_async_client(),
+        **MODEL_DEFAULTS.get(model_name, _DEFAULT_MODEL_PARAMS)
+    )
 
 
 def create_ai_agent(model_name: str, data_dicts: Dict[str, Any], custom_prompt: Optional[str] = None):
@@ -120,17 +330,12 @@ def create_ai_agent(model_name: str, data_dicts: Dict[str, Any], custom_prompt:
     setup_langsmith()
     
     # 获取API密钥
-    api_key = st.secrets.get("DASHSCOPE_API_KEY", "")
+    api_key = get_secret("DASHSCOPE_API_KEY")
     if not api_key:
         raise ValueError("请配置DASHSCOPE_API_KEY")
     
-    # 创建聊天模型（使用阿里云兼容接口）
-    llm = ChatOpenAI(
-        api_key=api_key,
-        model=model_name,
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-        temperature=0.1
-    )
+    # 获取聊天模型（同一模型和密钥复用同一个实例）
+    llm = _get_llm(model_name, api_key)
     
     # 使用自定义提示词或默认提示词
     if custom_prompt:
@@ -138,65 +343,162 @@ def create_ai_agent(model_name: str, data_dicts: Dict[str, Any], custom_prompt:
     else:
         system_prompt = create_default_prompt(data_dicts)
     
+    # 提示词提到JSON时才启用JSON模式，否则自定义提示词的请求会被接口拒绝
+    if model_name not in _NO_JSON_MODE_MODELS and "json" in system_prompt.lower():
+        llm = llm.bind(response_format=_JSON_RESPONSE_FORMAT)
+    
     # 创建简单的标签提取器
     class TagExtractor:
         def __init__(self, llm, system_prompt, data_dicts):
             self.llm = llm
             self.system_prompt = system_prompt
             self.data_dicts = data_dicts
+            # 预先建立标签集合，验证结果时只需O(1)查找
+            self._countries_set = frozenset(data_dicts['countries'])
+            self._degrees_set = frozenset(data_dicts['degrees'])
+            self._majors_set = frozenset(data_dicts['majors'])
+            self._sub_major_index = {
+                major: frozenset(info['children'])
+                for major, info in data_dicts['majors'].items()
+            }
             
         def extract(self, user_input: str) -> Dict[str, Any]:
             """提取标签"""
             try:
-                # 创建消息
-                messages = [
-                    SystemMessage(content=self.system_prompt),
-                    HumanMessage(content=user_input)
-                ]
-                
                 # 调用模型
-                response = self.llm(messages)
-                response_text = response.content
+                response = self.llm.invoke(self._build_messages(user_input))
+                return self.build_result(response.content)
+            except Exception as e:
+                return self._error_result(e)
+        
+        async def aextract(self, user_input: str) -> Dict[str, Any]:
+            """异步提取标签"""
+            try:
+                # 异步调用模型，等待期间不阻塞事件循环
+                response = await self.llm.ainvoke(self._build_messages(user_input))
+                return self.build_result(response.content)
+            except Exception as e:
+                return self._error_result(e)
+        
+        async def aextract_many(self, user_inputs: List[str], max_concurrency: int = 16) -> List[Dict[str, Any]]:
+            """
+            并发提取多条输入的标签
+            
+            Args:
+                user_inputs: 用户输入列表
+                max_concurrency: 最大并发请求数，避免超出接口的QPM限制
                 
-                # 解析JSON响应
-                raw_result = self._parse_response(response_text)
+            Returns:
+                与输入顺序一致的标签结果列表
+            """
+            semaphore = asyncio.Semaphore(max_concurrency)
+            
+            async def _extract(user_input: str) -> Dict[str, Any]:
+                async with semaphore:
+                    return await self.aextract(user_input)
+            
+            return list(await asyncio.gather(*(_extract(user_input) for user_input in user_inputs)))
+        
+        def extract_many(self, user_inputs: List[str], max_concurrency: int = 16) -> List[Dict[str, Any]]:
+            """并发提取多条输入的标签（同步接口，在后台事件循环中执行）"""
+            return run_async(self.aextract_many(user_inputs, max_concurrency))
+        
+        def extract_batch(self, user_inputs: List[str]) -> List[Dict[str, Any]]:
+            """一次模型调用提取多条输入的标签，结果无法解析时退回逐条并发提取"""
+            if not user_inputs:
+                return []
+            try:
+                messages = [
+                    SystemMessage(content=self.system_prompt + _BATCH_INSTRUCTION),
+                    HumanMessage(content="\n".join(
+                        f"[{i}] {user_input}" for i, user_input in enumerate(user_inputs)
+                    ))
+                ]
                 
-                # 验证和标准化结果
-                validated_result = self._validate_result(raw_result)
+                # 输出长度上限按条数放大
+                llm = self.llm
+                max_tokens = getattr(self.llm, 'max_tokens', None)
+                if max_tokens:
+                    llm = self.llm.bind(max_tokens=max_tokens * len(user_inputs))
                 
-                # 在返回结果中包含原始AI返回和验证后的结果
-                validated_result['_raw_ai_response'] = raw_result
-                validated_result['_full_ai_response'] = response_text
+                response = llm.invoke(messages)
+                response_text = response.content
+                items = self._parse_response(response_text).get('results')
                 
-                return validated_result
+                if isinstance(items, list) and len(items) == len(user_inputs) and all(isinstance(item, dict) for item in items):
+                    results = []
+                    for item in items:
+                        validated_result = self._validate_result(item)
+                        validated_result['_raw_ai_response'] = item
+                        validated_result['_full_ai_response'] = response_text
+                        results.append(validated_result)
+                    return results
                 
+                print("批量响应格式不正确，改为逐条并发提取")
             except Exception as e:
-                print(f"标签提取错误: {e}")
-                return {
-                    "country": None,
-                    "degree": None,
-                    "major": None,
-                    "sub_major": None,
-                    "error": str(e),
-                    "_raw_ai_response": None,
-                    "_full_ai_response": None
-                }
+                print(f"批量标签提取错误: {e}，改为逐条并发提取")
+            
+            return self.extract_many(user_inputs)
+        
+        async def astream(self, user_input: str) -> AsyncIterator[str]:
+            """流式输出模型响应文本"""
+            async for chunk in self.llm.astream(self._build_messages(user_input)):
+                yield chunk.content or ""
+        
+        def _build_messages(self, user_input: str):
+            """创建消息"""
+            return [
+                SystemMessage(content=self.system_prompt),
+                HumanMessage(content=user_input)
+            ]
+        
+        def build_result(self, response_text: str) -> Dict[str, Any]:
+            """解析并验证模型响应"""
+            # 解析JSON响应
+            raw_result = self._parse_response(response_text)
+            
+            # 验证和标准化结果
+            validated_result = self._validate_result(raw_result)
+            
+            # 在返回结果中包含原始AI返回和验证后的结果
+            validated_result['_raw_ai_response'] = raw_result
+            validated_result['_full_ai_response'] = response_text
+            
+            return validated_result
+        
+        def _error_result(self, e: Exception) -> Dict[str, Any]:
+            """构造提取失败时的结果"""
+            print(f"标签提取错误: {e}")
+            return {
+                "country": None,
+                "degree": None,
+                "major": None,
+                "sub_major": None,
+                "error": str(e),
+                "_raw_ai_response": None,
+                "_full_ai_response": None
+            }
         
         def _parse_response(self, response_text: str) -> Dict[str, Any]:
             """解析模型响应"""
             try:
-                # 尝试提取JSON
-                json_match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(1)
+                # 尝试提取```json代码块中的JSON
+                _, fence, rest = response_text.partition('```json')
+                if fence:
+                    json_str = rest.partition('```')[0].strip()
                 else:
                     # 如果没有代码块，尝试直接解析
                     json_str = response_text.strip()
+                    # 响应中夹杂其他文本时，只取其中的JSON对象
+                    if not json_str.startswith('{'):
+                        object_match = _JSON_RE.search(json_str)
+                        if object_match:
+                            json_str = object_match.group(0)
                 
-                result = json.loads(json_str)
+                result = orjson.loads(json_str)
                 return result
                 
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 print(f"JSON解析错误: {e}")
                 print(f"原始响应: {response_text}")
                 return {
@@ -209,31 +511,20 @@ def create_ai_agent(model_name: str, data_dicts: Dict[str, Any], custom_prompt:
         
         def _validate_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
             """验证和标准化结果"""
-            validated = {
-                "country": None,
-                "degree": None,
-                "major": None,
-                "sub_major": None
-            }
-            
-            # 验证国家
-            if result.get('country') and result['country'] in self.data_dicts['countries']:
-                validated['country'] = result['country']
-            
-            # 验证学历
-            if result.get('degree') and result['degree'] in self.data_dicts['degrees']:
-                validated['degree'] = result['degree']
-            
-            # 验证专业
+            country = result.get('country')
+            degree = result.get('degree')
             major = result.get('major')
             sub_major = result.get('sub_major')
             
-            if major and major in self.data_dicts['majors']:
-                validated['major'] = major
-                
-                # 验证二级专业
-                if sub_major and sub_major in self.data_dicts['majors'][major]['children']:
-                    validated['sub_major'] = sub_major
+            # 每个字段只做一次集合成员判断，不在标签池中的值置为None
+            validated = {
+                "country": country if country in self._countries_set else None,
+                "degree": degree if degree in self._degrees_set else None,
+                "major": major if major in self._majors_set else None
+            }
+            
+            # 二级专业必须属于已验证的一级专业
+            validated['sub_major'] = sub_major if validated['major'] and sub_major in self._sub_major_index[major] else None
             
             # 如果有错误信息，保留它
             if 'error' in result:
@@ -244,9 +535,9 @@ def create_ai_agent(model_name: str, data_dicts: Dict[str, Any], custom_prompt:
     return TagExtractor(llm, system_prompt, data_dicts)
 
 
-def extract_tags(agent, user_input: str) -> Dict[str, Any]:
+async def extract_tags(agent, user_input: str) -> Dict[str, Any]:
     """
-    使用代理提取标签
+    使用代理异步提取标签
     
     Args:
         agent: AI代理实例
@@ -255,4 +546,34 @@ def extract_tags(agent, user_input: str) -> Dict[str, Any]:
     Returns:
         提取的标签结果
     """
-    return agent.extract(user_input) 
\ No newline at end of file
+    return await agent.aextract(user_input)
+
+
+async def extract_tags_batch(agent, user_inputs: List[str], max_concurrency: int = 16) -> List[Dict[str, Any]]:
+    """
+    并发提取多条输入的标签
+    
+    Args:
+        agent: AI代理实例
+        user_inputs: 用户输入列表
+        max_concurrency: 最大并发请求数，避免超出接口的QPM限制
+        
+    Returns:
+        与输入顺序一致的标签结果列表
+    """
+    return await agent.aextract_many(user_inputs, max_concurrency)
+
+
+async def stream_tags(agent, user_input: str) -> AsyncIterator[str]:
+    """
+    使用代理流式获取模型响应，完整文本交给 agent.build_result 解析
+    
+    Args:
+        agent: AI代理实例
+        user_input: 用户输入
+        
+    Returns:
+        逐段产出响应文本的异步生成器
+    """
+    async for text in agent.astream(user_input):
+        yield text
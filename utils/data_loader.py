@@ -5,43 +5,149 @@
 用于加载和处理JSON数据字典
 """
 
-import json
+import functools
+import itertools
 import os
+import pickle
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, Optional, Tuple
+
+import orjson
+
+
+# 需要加载的数据文件
+DATA_FILES = {
+    'countries': 'countries_dict.json',
+    'majors': 'majors_dict.json', 
+    'degrees': 'degrees_dict.json'
+}
+
+# 二进制数据文件（pickle），由 dataprocess.py 或首次解析JSON后写入，存在且不旧于JSON文件时优先读取
+BINARY_DATA_FILE = 'data_dicts.pkl'
+# 二进制数据文件的格式版本，数据结构变化时递增，旧文件会被忽略
+BINARY_DATA_VERSION = 1
+
+
+def cache_by_identity(func: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """
+    按参数对象的身份缓存最近一次调用结果
+    
+    用于参数是不可哈希的字典、且同一个字典对象会被反复传入的场景
+    （例如 load_data_dicts 返回的缓存字典）。调用方不应修改传入的字典。
+    
+    Args:
+        func: 只接受一个参数的函数
+        
+    Returns:
+        带缓存的函数
+    """
+    last_call = [None]  # (参数对象, 结果)，整体替换保证线程间读到的是一致的组合
+    
+    @functools.wraps(func)
+    def wrapper(obj):
+        entry = last_call[0]
+        if entry is None or entry[0] is not obj:
+            entry = (obj, func(obj))
+            last_call[0] = entry
+        return entry[1]
+    
+    return wrapper
+
+
+def _get_mtime(file_path: Path) -> Optional[float]:
+    """获取文件修改时间，文件不存在时返回None"""
+    try:
+        return file_path.stat().st_mtime
+    except OSError:
+        return None
 
 
 def load_data_dicts(data_dir: str = "output") -> Optional[Dict[str, Any]]:
     """
     加载所有数据字典
     
+    优先读取二进制数据文件，不存在、已过期或版本不符时解析JSON文件，
+    并把解析结果写回二进制数据文件，进程重启后无需再解析JSON。
+    以JSON文件修改时间作为缓存键，文件未变化时直接返回上次加载的结果。
+    返回的字典在多次调用间共享，调用方不应修改。
+    
     Args:
         data_dir: 数据目录路径
         
     Returns:
         包含所有数据字典的字典，如果加载失败返回None
     """
+    base_path = Path(__file__).parent.parent / data_dir
+    mtimes = tuple(
+        (filename, _get_mtime(base_path / filename))
+        for filename in DATA_FILES.values()
+    )
+    return _load_data_dicts_cached(data_dir, mtimes)
+
+
+def save_binary_data(data_dir: Path, data_dicts: Dict[str, Any]) -> None:
+    """
+    将数据字典写入带版本号的二进制数据文件
+    
+    先写临时文件再替换，避免其他进程读到写了一半的文件。
+    
+    Args:
+        data_dir: 数据目录路径
+        data_dicts: 数据字典
+    """
+    binary_file = Path(data_dir) / BINARY_DATA_FILE
+    tmp_file = binary_file.with_name(f"{BINARY_DATA_FILE}.{os.getpid()}.tmp")
+    payload = {'version': BINARY_DATA_VERSION, 'data': data_dicts}
+    tmp_file.write_bytes(pickle.dumps(payload, protocol=5))
+    tmp_file.replace(binary_file)
+
+
+def _load_binary(base_path: Path, mtimes: Tuple[Tuple[str, Optional[float]], ...]) -> Optional[Dict[str, Any]]:
+    """读取二进制数据文件，文件不存在、比JSON文件旧、损坏或版本不符时返回None"""
+    binary_mtime = _get_mtime(base_path / BINARY_DATA_FILE)
+    if binary_mtime is None:
+        return None
+    if any(mtime is not None and mtime > binary_mtime for _, mtime in mtimes):
+        return None
+    
+    try:
+        payload = pickle.loads((base_path / BINARY_DATA_FILE).read_bytes())
+    except Exception as e:
+        print(f"读取二进制数据文件失败，改用JSON文件: {e}")
+        return None
+    
+    if not isinstance(payload, dict) or payload.get('version') != BINARY_DATA_VERSION:
+        return None
+    return payload['data']
+
+
+@functools.lru_cache(maxsize=4)
+def _load_data_dicts_cached(data_dir: str, mtimes: Tuple[Tuple[str, Optional[float]], ...]) -> Optional[Dict[str, Any]]:
+    """按(数据目录, 各JSON文件修改时间)缓存的实际加载逻辑"""
     try:
         base_path = Path(__file__).parent.parent / data_dir
         
-        # 加载各个数据文件
-        files_to_load = {
-            'countries': 'countries_dict.json',
-            'majors': 'majors_dict.json', 
-            'degrees': 'degrees_dict.json'
-        }
+        data_dicts = _load_binary(base_path, mtimes)
+        if data_dicts is not None:
+            return data_dicts
         
         data_dicts = {}
         
-        for key, filename in files_to_load.items():
+        for key, filename in DATA_FILES.items():
             file_path = base_path / filename
             
             if not file_path.exists():
                 print(f"警告: 文件 {file_path} 不存在")
                 continue
                 
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data_dicts[key] = json.load(f)
+            data_dicts[key] = orjson.loads(file_path.read_bytes())
+        
+        # 数据完整时写回二进制数据文件（目录只读等写入失败不影响本次加载）
+        if len(data_dicts) == len(DATA_FILES):
+            try:
+                save_binary_data(base_path, data_dicts)
+            except OSError as e:
+                print(f"写入二进制数据文件失败: {e}")
                 
         return data_dicts
         
@@ -86,36 +192,27 @@ def get_major_list(majors_dict: Dict[str, Any]) -> str:
     Returns:
         专业列表字符串
     """
-    major_list = []
-    
-    for first_level, info in majors_dict.items():
-        major_list.append(f"{first_level}")
-        
-        # 添加二级专业
-        for second_level in info['children'].keys():
-            major_list.append(f"  - {second_level}")
-    
-    return "\n".join(major_list)
+    return "\n".join(itertools.chain.from_iterable(
+        # 一级专业，后接其下的二级专业
+        itertools.chain((first_level,), (f"  - {second_level}" for second_level in info['children']))
+        for first_level, info in majors_dict.items()
+    ))
 
 
+@cache_by_identity
 def get_flat_major_mapping(majors_dict: Dict[str, Any]) -> Dict[str, str]:
     """
     获取扁平化的专业映射（二级专业 -> 一级专业）
     
+    一级专业映射到自己；按对象身份缓存，同一个专业字典只构建一次，调用方不应修改返回的映射。
+    
     Args:
         majors_dict: 专业字典
         
     Returns:
         扁平化的专业映射字典
     """
-    mapping = {}
-    
-    for first_level, info in majors_dict.items():
-        # 一级专业映射到自己
-        mapping[first_level] = first_level
-        
-        # 二级专业映射到一级专业
-        for second_level in info['children'].keys():
-            mapping[second_level] = first_level
-            
-    return mapping 
\ No newline at end of file
+    return dict(itertools.chain.from_iterable(
+        itertools.chain(((first_level, first_level),), ((second_level, first_level) for second_level in info['children']))
+        for first_level, info in majors_dict.items()
+    ))
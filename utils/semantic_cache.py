@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+语义缓存模块
+用句向量判断新输入是否与已识别过的输入语义相近，相近时直接复用识别结果
+"""
+
+import threading
+from collections import OrderedDict
+from typing import AbstractSet, Dict, Any, FrozenSet, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+# 默认的中文句向量模型
+DEFAULT_EMBEDDING_MODEL = "BAAI/bge-small-zh-v1.5"
+
+
+def load_embedder(model_name: str = DEFAULT_EMBEDDING_MODEL):
+    """
+    加载句向量模型
+
+    Args:
+        model_name: sentence-transformers 模型名称
+
+    Returns:
+        句向量模型实例，未安装 sentence-transformers 或加载失败时返回None
+    """
+    try:
+        # 延迟导入，未启用语义缓存时不加载torch
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    except ImportError:
+        print("未安装sentence-transformers，语义缓存已禁用")
+    except Exception as e:
+        print(f"加载句向量模型失败: {e}")
+    return None
+
+
+def find_terms(text: str, vocabulary: Iterable[str]) -> FrozenSet[str]:
+    """
+    找出文本中字面出现的词表词条
+    
+    Args:
+        text: 用户输入
+        vocabulary: 词表（如全部标签名称）
+        
+    Returns:
+        出现在文本中的词条集合
+    """
+    return frozenset(term for term in vocabulary if term in text)
+
+
+class SemanticCache:
+    """基于余弦相似度的LRU语义缓存"""
+
+    def __init__(self, embedder, threshold: float = 0.93, max_size: int = 256):
+        """
+        初始化语义缓存
+
+        Args:
+            embedder: 句向量模型，需提供 encode(text, normalize_embeddings=True)
+            threshold: 命中所需的最小余弦相似度
+            max_size: 最多缓存的输入条数，超出时淘汰最久未使用的条目
+        """
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, FrozenSet[str], Dict[str, Any]]]" = OrderedDict()
+        self._keys: List[str] = []
+        self._terms: List[FrozenSet[str]] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._last_embedding: Tuple[Optional[str], Optional[np.ndarray]] = (None, None)
+        self._lock = threading.Lock()
+
+    def _embed(self, text: str) -> np.ndarray:
+        """计算归一化句向量（lookup后紧接着add同一文本时复用上次结果）"""
+        last_text, last_vector = self._last_embedding
+        if last_text == text:
+            return last_vector
+        vector = np.asarray(self.embedder.encode(text, normalize_embeddings=True), dtype=np.float32)
+        self._last_embedding = (text, vector)
+        return vector
+
+    def lookup(self, text: str, terms: AbstractSet[str] = frozenset()) -> Optional[Dict[str, Any]]:
+        """
+        查找语义相近的已缓存结果
+        
+        只比较字面词条与输入一致的条目：整句向量对"英国"/"美国"这类实体差异不敏感，
+        仅凭相似度会把"想去美国读硕"命中到"想去英国读硕"的结果上。
+        计算句向量等出错时视为未命中，不影响后续调用模型。
+
+        Args:
+            text: 用户输入
+            terms: 输入中字面出现的标签词条（见 find_terms）
+
+        Returns:
+            命中时返回缓存的识别结果，否则返回None
+        """
+        try:
+            vector = self._embed(text)
+            with self._lock:
+                if not self._entries:
+                    return None
+                if self._matrix is None:
+                    self._keys = list(self._entries)
+                    self._terms = [self._entries[key][1] for key in self._keys]
+                    self._matrix = np.stack([self._entries[key][0] for key in self._keys])
+                # 向量已归一化，点积即余弦相似度；词条不一致的条目不参与比较
+                scores = self._matrix @ vector
+                scores[[entry_terms != terms for entry_terms in self._terms]] = -np.inf
+                best = int(np.argmax(scores))
+                if scores[best] < self.threshold:
+                    return None
+                key = self._keys[best]
+                self._entries.move_to_end(key)
+                return self._entries[key][2]
+        except Exception as e:
+            print(f"语义缓存查找失败: {e}")
+            return None
+
+    def add(self, text: str, result: Dict[str, Any], terms: AbstractSet[str] = frozenset()) -> None:
+        """
+        缓存一条识别结果，出错时忽略
+
+        Args:
+            text: 用户输入
+            result: 识别结果
+            terms: 输入中字面出现的标签词条（见 find_terms）
+        """
+        try:
+            vector = self._embed(text)
+        except Exception as e:
+            print(f"语义缓存写入失败: {e}")
+            return
+        with self._lock:
+            self._entries[text] = (vector, frozenset(terms), result)
+            self._entries.move_to_end(text)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            # 条目变化后，下次查找时重建向量矩阵
+            self._matrix = None